@@ -1,29 +1,164 @@
+import argparse
+import json
+import math
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import avg, col, monotonically_increasing_id, when
+from pyspark.sql.functions import (
+    avg, col, count, isnan, monotonically_increasing_id, when,
+)
 from pyspark.ml.recommendation import ALS
-from pyspark.ml.evaluation import RegressionEvaluator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src" / "models"))
+from evaluation import report_probe, setup_logging  # noqa: E402
 
 # parquet files with date column dropped by dropdate.py
 BASE = "/gpfs/projects/AMS598/class2025/Shaikh_Tasfia/ams598_netflixrecsys/data/processed"
+CF_DIR = "/gpfs/projects/AMS598/class2025/Shaikh_Tasfia/ams598_netflixrecsys/collaborative_filtering"
 
+# Spark execution profile; override with --profile <json> and/or CLI flags
+DEFAULT_PROFILE = {
+    "master": "local[8]",
+    "driver_memory": "40g",
+    "executor_memory": "40g",
+    "shuffle_partitions": None,      # None -> derived from input size
+    "target_partition_mb": 64,       # on-disk parquet MB per partition
+    "min_partitions": 16,
+    "adaptive": True,                # AQE: coalesce partitions / switch join strategy
+    "kryo": True,
+    "broadcast_threshold_mb": 128,   # lets ALS's internal factor joins broadcast
+    "checkpoint_dir": None,          # truncates ALS lineage between iterations if set
+    "storage_level": "MEMORY_AND_DISK",
+}
 
-def main():
-    # spark session setup
-    spark = (
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"):
+        return True
+    if text in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+
+def _converter(key):
+    default = DEFAULT_PROFILE[key]
+    if isinstance(default, bool):
+        return parse_bool
+    if isinstance(default, int) or key == "shuffle_partitions":
+        return int
+    return str
+
+
+def coerce_profile(profile, source):
+    """Convert values with the same parsers as the CLI; None keeps optional keys unset."""
+    coerced = {}
+    for key, value in profile.items():
+        if value is None:
+            coerced[key] = None
+            continue
+        try:
+            coerced[key] = _converter(key)(value)
+        except ValueError as e:
+            raise ValueError(f"Bad value for {key!r} in {source}: {e}") from None
+
+    level = coerced.get("storage_level")
+    if level is not None and not isinstance(getattr(StorageLevel, level, None), StorageLevel):
+        raise ValueError(f"Unknown storage_level in {source}: {level!r}")
+    return coerced
+
+
+def load_profile(argv=None):
+    parser = argparse.ArgumentParser(description="ALS collaborative filtering on Netflix")
+    parser.add_argument("--profile", help="JSON file with Spark execution settings")
+    for key in DEFAULT_PROFILE:
+        flag = "--" + key.replace("_", "-")
+        parser.add_argument(flag, dest=key, type=_converter(key))
+    args = parser.parse_args(argv)
+
+    profile = dict(DEFAULT_PROFILE)
+    if args.profile:
+        with open(args.profile) as f:
+            file_profile = json.load(f)
+        unknown = set(file_profile) - set(DEFAULT_PROFILE)
+        if unknown:
+            raise ValueError(f"Unknown profile keys in {args.profile}: {sorted(unknown)}")
+        profile.update(coerce_profile(file_profile, args.profile))
+    cli_profile = {
+        key: getattr(args, key) for key in DEFAULT_PROFILE if getattr(args, key) is not None
+    }
+    profile.update(coerce_profile(cli_profile, "command line"))
+    return profile
+
+
+def input_size_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+        if not name.startswith((".", "_"))
+    )
+
+
+def pick_partitions(profile, path):
+    if profile["shuffle_partitions"]:
+        return profile["shuffle_partitions"]
+    target = profile["target_partition_mb"] * 1024 * 1024
+    return max(profile["min_partitions"], math.ceil(input_size_bytes(path) / target))
+
+
+def build_spark(profile, partitions):
+    builder = (
         SparkSession.builder
         .appName("NetflixALS_CF")
-        .master("local[8]")   # use 8 cores
-        .config("spark.driver.memory", "40g")
-        .config("spark.executor.memory", "40g")
-        .config("spark.sql.shuffle.partitions", "400")
-        .getOrCreate()
+        .master(profile["master"])
+        .config("spark.driver.memory", profile["driver_memory"])
+        .config("spark.executor.memory", profile["executor_memory"])
+        .config("spark.sql.shuffle.partitions", str(partitions))
+        .config("spark.sql.adaptive.enabled", str(profile["adaptive"]).lower())
+        .config("spark.sql.adaptive.coalescePartitions.enabled", str(profile["adaptive"]).lower())
+        .config(
+            "spark.sql.autoBroadcastJoinThreshold",
+            str(profile["broadcast_threshold_mb"] * 1024 * 1024),
+        )
     )
+    if profile["kryo"]:
+        builder = (
+            builder
+            .config("spark.serializer", "org.apache.spark.serializer.KryoSerializer")
+            .config("spark.kryoserializer.buffer.max", "512m")
+        )
+
+    spark = builder.getOrCreate()
+    if profile["checkpoint_dir"]:
+        spark.sparkContext.setCheckpointDir(profile["checkpoint_dir"])
+    return spark
+
+
+def main(argv=None):
+    setup_logging()
+    profile = load_profile(argv)
+    ratings_path = f"{BASE}/ratings_train_no_probe.parquet"
+    partitions = pick_partitions(profile, ratings_path)
+
+    # spark session setup
+    spark = build_spark(profile, partitions)
 
     spark.sparkContext.setLogLevel("WARN")
+    print("Spark profile:", json.dumps(profile, sort_keys=True))
+    print(f"Shuffle/ratings partitions: {partitions}")
 
     # load data
     ratings = (
-        spark.read.parquet(f"{BASE}/ratings_train_no_probe.parquet")
+        spark.read.parquet(ratings_path)
              .select("user_id", "movie_id", "rating")
     )
 
@@ -37,8 +172,17 @@ def main():
              .select("user_id", "movie_id")
     )
 
-    # Spread ratings across more partitions to reduce per-task memory pressure
-    ratings = ratings.repartition(400, "user_id")
+    # Spread ratings across partitions to reduce per-task memory pressure, and
+    # persist so ALS, the global mean and evaluation reuse one read + shuffle
+    ratings = (
+        ratings.repartition(partitions, "user_id")
+               .persist(getattr(StorageLevel, profile["storage_level"]))
+    )
+
+    # one pass materializes the cache and gives the cold-start fallback
+    stats = ratings.agg(count("*").alias("n"), avg("rating").alias("mean_rating")).collect()[0]
+    global_mean = stats["mean_rating"]
+    print(f"Training ratings: {stats['n']} rows (persisted as {profile['storage_level']})")
 
     # sanity checks (will show up in netflix_als.out)
     print("ratings schema:")
@@ -58,38 +202,50 @@ def main():
         maxIter=10,
         nonnegative=True,
         implicitPrefs=False,
-        coldStartStrategy="drop",  # drop NaN predictions during evaluation
+        coldStartStrategy="nan",   # keep cold-start rows; NaN is filled with the global mean
         seed=123,
+        checkpointInterval=5 if profile["checkpoint_dir"] else -1,
     )
 
     print("Fitting ALS model ...")
     model = als.fit(ratings)
     print("ALS training finished.")
 
-    # evaluate RMSE
-    print("Evaluating on probe set ...")
-    pred_probe = model.transform(probe)  # adds "prediction" column
+    print(f"Global mean rating (fallback) = {global_mean:.4f}")
+
+    # probe predictions in probe_ratings order, evaluated locally with NumPy
+    print("Scoring probe set ...")
+    probe_with_id = probe.withColumn("row_id", monotonically_increasing_id())
+    pred_probe = (
+        model.transform(probe_with_id)  # adds "prediction" column
+        .withColumn(
+            "prediction",
+            when(isnan(col("prediction")), global_mean).otherwise(col("prediction")),
+        )
+        .orderBy("row_id")
+        .select("prediction", "rating")
+        .toPandas()
+    )
 
-    evaluator = RegressionEvaluator(
-        metricName="rmse",
-        labelCol="rating",
-        predictionCol="prediction",
+    os.makedirs(CF_DIR, exist_ok=True)
+    probe_out = f"{CF_DIR}/als_probe_predictions.npy"
+    print(f"Saving probe predictions to {probe_out} ...")
+    np.save(probe_out, pred_probe["prediction"].to_numpy(np.float32))
+
+    report_probe(
+        pred_probe["prediction"].to_numpy(), BASE, "Probe (ALS)",
+        label=pred_probe["rating"].to_numpy(),
     )
-    rmse = evaluator.evaluate(pred_probe)
-    print(f"\n*** Probe RMSE (ALS) = {rmse:.4f} ***\n")
 
     # Predict on qualifying_to_predict
     qual_with_id = qual.withColumn("row_id", monotonically_increasing_id())
 
     pred_qual = model.transform(qual_with_id)
 
-    # Handle cold-start (users/movies unseen in training → prediction = null)
-    global_mean = ratings.agg(avg("rating").alias("mean_rating")).collect()[0]["mean_rating"]
-    print(f"Global mean rating (fallback) = {global_mean:.4f}")
-
+    # Handle cold-start (users/movies unseen in training → prediction = NaN)
     pred_qual = pred_qual.withColumn(
         "pred_rating",
-        when(col("prediction").isNull(), global_mean).otherwise(col("prediction")),
+        when(isnan(col("prediction")), global_mean).otherwise(col("prediction")),
     )
 
     # Order back by row_id to match qualifying_to_predict order
@@ -100,10 +256,7 @@ def main():
     )
 
     # save predictions
-    out_dir = (
-        "/gpfs/projects/AMS598/class2025/"
-        "Shaikh_Tasfia/ams598_netflixrecsys/collaborative_filtering/als_qual_predictions"
-    )
+    out_dir = f"{CF_DIR}/als_qual_predictions"
 
     print(f"Saving qualifying predictions to {out_dir} (CSV, coalesced to 1 file) ...")
     (
@@ -115,6 +268,7 @@ def main():
         .csv(out_dir)
     )
 
+    ratings.unpersist()
     print("Done.")
     spark.stop()
 
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Validate every processed Parquet artifact without loading full tables.
+
+Row counts, null counts and min/max come straight from the Parquet footer
+statistics. Distinct counts are computed by streaming the id columns one
+row group at a time into bitmap (bounded integer ids) or HyperLogLog
+sketches, so memory stays flat even for the 100M-row ratings tables.
+
+Cross-file invariants checked (each only once its inputs exist):
+    - probe pairs are a subset of ratings_full
+    - ratings_train_no_probe and probe pairs are disjoint
+    - qualifying movie/user ids fall within the known ranges
+
+Artifacts not built yet are skipped, so this can run after every stage.
+Artifact names given on the command line are required instead:
+
+    python src/data_prep/validate_artifacts.py ratings_full probe_pairs
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Netflix Prize id ranges
+N_MOVIES = 17770
+MAX_USER_ID = 2649429
+
+# Bitmaps are used for integer columns whose max id is below this bound
+BITMAP_MAX_ID = 1 << 26
+
+# artifact name -> (file name, columns that must be null-free,
+#                   columns to sketch for distinct counts)
+ARTIFACTS = {
+    "movies": ("movies.parquet", ["movie_id", "title"], ["movie_id"]),
+    "ratings_full": (
+        "ratings_full.parquet",
+        ["movie_id", "user_id", "rating", "date"],
+        ["movie_id", "user_id", "date"],
+    ),
+    "ratings_train_no_probe": (
+        "ratings_train_no_probe.parquet",
+        ["movie_id", "user_id", "rating", "date"],
+        ["movie_id", "user_id", "date"],
+    ),
+    "probe_pairs": ("probe_pairs.parquet", ["movie_id", "user_id"], ["movie_id", "user_id"]),
+    "probe_ratings": (
+        "probe_ratings.parquet",
+        ["movie_id", "user_id", "rating", "date"],
+        ["movie_id", "user_id"],
+    ),
+    "qualifying": (
+        "qualifying_to_predict.parquet",
+        ["movie_id", "user_id", "date"],
+        ["movie_id", "user_id", "date"],
+    ),
+    "movie_features": ("movie_features.parquet", ["movie_id", "n_ratings"], ["movie_id"]),
+    "user_features": ("user_features.parquet", ["user_id", "n_ratings"], ["user_id"]),
+}
+
+# column -> (low, high) inclusive value range, checked against footer min/max
+VALUE_RANGES = {
+    "movie_id": (1, N_MOVIES),
+    "user_id": (1, MAX_USER_ID),
+    "rating": (1, 5),
+}
+
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+
+# --------------------------
+# Distinct-count sketches
+# --------------------------
+
+class BitmapSketch:
+    """Exact distinct counter for integer values in [min_id, max_id]."""
+
+    def __init__(self, max_id: int, min_id: int = 0):
+        self.min_id = min_id
+        self.bits = np.zeros(max_id - min_id + 1, dtype=bool)
+
+    def update(self, values: np.ndarray):
+        self.bits[values - self.min_id if self.min_id else values] = True
+
+    def count(self) -> int:
+        return int(self.bits.sum())
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    n = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        n[mask] += shift
+        x = np.where(mask, x >> np.uint64(shift), x)
+    return n + (x > 0).astype(np.uint8)
+
+
+class HyperLogLogSketch:
+    """Approximate distinct counter (~0.8% std error at p=14)."""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values: np.ndarray):
+        h = _splitmix64(values.astype(np.int64).view(np.uint64))
+        idx = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p + 1) - _bit_length(rest)
+        np.maximum.at(self.registers, idx, rank)
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+def _to_day(value) -> int:
+    return int(np.datetime64(value, "D").astype(np.int64))
+
+
+def _make_sketch(col: dict):
+    """
+    Bitmap for bounded integer ids and for dates (as day numbers); HLL for
+    anything else or when the footer min/max is partial.
+    """
+    if not col["complete"] or col["max"] is None:
+        return HyperLogLogSketch()
+
+    if pa.types.is_timestamp(col["type"]) or pa.types.is_date(col["type"]):
+        return BitmapSketch(_to_day(col["max"]), min_id=_to_day(col["min"]))
+
+    if (
+        pa.types.is_integer(col["type"])
+        and 0 <= col["min"]
+        and col["max"] < BITMAP_MAX_ID
+    ):
+        return BitmapSketch(int(col["max"]))
+    return HyperLogLogSketch()
+
+
+def _as_int_array(column) -> np.ndarray:
+    """
+    Convert an Arrow column (ints, dates or timestamps) to a null-free int64
+    array; temporal values become days since 1970-01-01.
+    """
+    column = column.drop_null()
+    if pa.types.is_null(column.type) or len(column) == 0:
+        return np.empty(0, dtype=np.int64)
+    arr = column.to_numpy()
+    if arr.dtype.kind == "M":
+        arr = arr.astype("datetime64[D]").astype(np.int64)
+    return arr
+
+
+# --------------------------
+# Footer statistics
+# --------------------------
+
+def footer_summary(path: Path) -> dict:
+    """
+    Aggregate row count and per-column null count / min / max from the
+    Parquet footer. Columns whose row groups lack statistics get None.
+    """
+    meta = pq.ParquetFile(path).metadata
+    schema = meta.schema.to_arrow_schema()
+    columns = {}
+
+    for rg in range(meta.num_row_groups):
+        row_group = meta.row_group(rg)
+        for ci in range(row_group.num_columns):
+            chunk = row_group.column(ci)
+            name = chunk.path_in_schema
+            if name not in schema.names:
+                continue  # nested / index columns
+            col = columns.setdefault(
+                name,
+                {"type": schema.field(name).type, "nulls": 0, "min": None, "max": None,
+                 "complete": True},
+            )
+            stats = chunk.statistics
+            if stats is None or not stats.has_null_count or not stats.has_min_max:
+                col["complete"] = False
+                if stats is not None and stats.has_null_count:
+                    col["nulls"] += stats.null_count
+                continue
+            col["nulls"] += stats.null_count
+            col["min"] = stats.min if col["min"] is None else min(col["min"], stats.min)
+            col["max"] = stats.max if col["max"] is None else max(col["max"], stats.max)
+
+    return {"rows": meta.num_rows, "row_groups": meta.num_row_groups, "columns": columns}
+
+
+# --------------------------
+# Streaming scans
+# --------------------------
+
+def pair_keys(movie_ids: np.ndarray, user_ids: np.ndarray) -> np.ndarray:
+    return movie_ids.astype(np.int64) * (MAX_USER_ID + 1) + user_ids.astype(np.int64)
+
+
+def scan_artifact(path: Path, summary: dict, sketch_columns, probe_keys=None) -> dict:
+    """
+    Stream the sketch columns row group by row group.
+
+    If probe_keys (sorted, unique int64 pair keys) is given, also count how
+    many rows of this file hit a probe pair and mark which probe pairs were
+    found at least once.
+    """
+    pf = pq.ParquetFile(path)
+    sketch_columns = [c for c in sketch_columns if c in summary["columns"]]
+    read_columns = list(sketch_columns)
+    if probe_keys is not None:
+        read_columns = sorted(set(read_columns) | {"movie_id", "user_id"})
+
+    sketches = {c: _make_sketch(summary["columns"][c]) for c in sketch_columns}
+    probe_hits = 0
+    probe_found = None if probe_keys is None else np.zeros(len(probe_keys), dtype=bool)
+
+    for rg in range(pf.num_row_groups):
+        table = pf.read_row_group(rg, columns=read_columns)
+        for c, sketch in sketches.items():
+            sketch.update(_as_int_array(table.column(c)))
+
+        if probe_keys is not None:
+            keys = pair_keys(
+                table.column("movie_id").to_numpy(),
+                table.column("user_id").to_numpy(),
+            )
+            pos = np.searchsorted(probe_keys, keys)
+            pos[pos == len(probe_keys)] = 0
+            match = probe_keys[pos] == keys
+            probe_hits += int(match.sum())
+            probe_found[pos[match]] = True
+
+    return {"sketches": sketches, "probe_hits": probe_hits, "probe_found": probe_found}
+
+
+def load_probe_keys(path: Path) -> np.ndarray:
+    table = pq.read_table(path, columns=["movie_id", "user_id"])
+    keys = pair_keys(table.column("movie_id").to_numpy(), table.column("user_id").to_numpy())
+    return np.unique(keys)
+
+
+# --------------------------
+# Validation
+# --------------------------
+
+def validate(proc_dir: Path, required=()) -> list:
+    """
+    Run all checks over proc_dir; returns a list of failure messages.
+
+    Missing artifacts are skipped unless listed in required.
+    """
+    unknown = set(required) - set(ARTIFACTS)
+    if unknown:
+        raise ValueError(f"Unknown artifacts: {sorted(unknown)}")
+
+    failures = []
+    summaries = {}
+    scans = {}
+
+    probe_path = proc_dir / ARTIFACTS["probe_pairs"][0]
+    probe_keys = load_probe_keys(probe_path) if probe_path.exists() else None
+    if probe_keys is not None:
+        logging.info("Probe pair keys: %d unique", len(probe_keys))
+        if len(probe_keys) == 0:
+            failures.append("probe_pairs: no probe pairs")
+            probe_keys = None
+
+    for name, (fname, non_null, sketch_columns) in ARTIFACTS.items():
+        path = proc_dir / fname
+        if not path.exists():
+            if name in required:
+                failures.append(f"{name}: missing artifact {path}")
+            else:
+                logging.info("=== %s: not built yet, skipping (%s) ===", name, path)
+            continue
+
+        summary = footer_summary(path)
+        summaries[name] = summary
+        logging.info("=== %s (%s) ===", name, fname)
+        logging.info("rows: %d, row groups: %d", summary["rows"], summary["row_groups"])
+
+        for col_name, col in summary["columns"].items():
+            logging.info(
+                "  %-20s nulls=%-8d min=%s max=%s%s",
+                col_name, col["nulls"], col["min"], col["max"],
+                "" if col["complete"] else " (partial stats)",
+            )
+
+        for col_name in non_null:
+            col = summary["columns"].get(col_name)
+            if col is None:
+                failures.append(f"{name}: missing column {col_name}")
+            elif col["nulls"] > 0:
+                failures.append(f"{name}.{col_name}: {col['nulls']} nulls")
+
+        for col_name, (low, high) in VALUE_RANGES.items():
+            col = summary["columns"].get(col_name)
+            if col is None or col["min"] is None:
+                continue
+            if col["min"] < low or col["max"] > high:
+                failures.append(
+                    f"{name}.{col_name}: range [{col['min']}, {col['max']}] "
+                    f"outside [{low}, {high}]"
+                )
+
+        check_probe = name in ("ratings_full", "ratings_train_no_probe")
+        scan = scan_artifact(
+            path,
+            summary,
+            sketch_columns,
+            probe_keys=probe_keys if check_probe else None,
+        )
+        scans[name] = scan
+        for col_name, sketch in scan["sketches"].items():
+            kind = "exact" if isinstance(sketch, BitmapSketch) else "approx"
+            logging.info("  distinct %-11s %d (%s)", col_name, sketch.count(), kind)
+
+    # --------------------------
+    # Cross-file invariants
+    # --------------------------
+    if probe_keys is not None:
+        if "ratings_full" in scans:
+            found = scans["ratings_full"]["probe_found"]
+            missing = int((~found).sum())
+            if missing > 0:
+                failures.append(
+                    f"probe not a subset of ratings_full: {missing} of "
+                    f"{len(probe_keys)} probe pairs not found"
+                )
+            duplicates = scans["ratings_full"]["probe_hits"] - int(found.sum())
+            if duplicates > 0:
+                failures.append(
+                    f"ratings_full: {duplicates} extra rows for probe pairs rated more than once"
+                )
+        if "ratings_train_no_probe" in scans:
+            hits = scans["ratings_train_no_probe"]["probe_hits"]
+            if hits != 0:
+                failures.append(f"train and probe overlap: {hits} training rows are probe pairs")
+
+    if {"ratings_full", "ratings_train_no_probe", "probe_pairs"} <= summaries.keys():
+        removed = summaries["ratings_full"]["rows"] - summaries["ratings_train_no_probe"]["rows"]
+        if removed != summaries["probe_pairs"]["rows"]:
+            failures.append(
+                f"ratings_full - train = {removed} rows, "
+                f"expected {summaries['probe_pairs']['rows']} probe rows"
+            )
+
+    if "qualifying" in scans:
+        qual_sketches = scans["qualifying"]["sketches"]
+        for col_name, ref_name in (("movie_id", "movies"), ("user_id", "ratings_full")):
+            if ref_name not in scans:
+                logging.info("Skipping qualifying.%s check: %s not built yet",
+                             col_name, ref_name)
+                continue
+            ref = scans[ref_name]["sketches"].get(col_name)
+            qual = qual_sketches.get(col_name)
+            if not isinstance(ref, BitmapSketch) or not isinstance(qual, BitmapSketch):
+                failures.append(
+                    f"qualifying.{col_name}: cannot check against {ref_name} "
+                    "(exact id bitmaps unavailable)"
+                )
+                continue
+            n = min(len(ref.bits), len(qual.bits))
+            unknown = int((qual.bits[:n] & ~ref.bits[:n]).sum()) + int(qual.bits[n:].sum())
+            if unknown > 0:
+                failures.append(f"qualifying.{col_name}: {unknown} ids not present in {ref_name}")
+
+    return failures
+
+
+def main():
+    setup_logging()
+    project_root = Path(__file__).resolve().parents[2]
+    proc_dir = project_root / "data" / "processed"
+
+    logging.info("Project root: %s", project_root)
+    logging.info("Processed dir: %s", proc_dir)
+
+    required = sys.argv[1:]
+    if required:
+        logging.info("Required artifacts: %s", ", ".join(required))
+
+    failures = validate(proc_dir, required)
+
+    if failures:
+        for msg in failures:
+            logging.error("FAILED: %s", msg)
+        sys.exit(1)
+    logging.info("All checks passed.")
+
+
+if __name__ == "__main__":
+    main()
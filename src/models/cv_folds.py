@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+K-fold cross-validation splits over memory-mapped rating arrays.
+
+The training ratings are materialized once as column .npy files; each
+split scheme is then stored as a single uint8 fold-id array (one byte per
+rating), never as copies of the data. Train/test masks for fold k are
+derived on the fly:
+
+    random: test = fold == k, train = fold != k
+    time:   each user's ratings are cut into K chronological slices;
+            test = fold == k, train = fold < k   (k >= 1, expanding window)
+
+The time scheme mirrors how the probe set holds out each user's most
+recent ratings.
+
+Folds can be evaluated in parallel worker processes with map_folds();
+workers reopen the memory maps from disk, so only paths are pickled.
+"""
+
+import json
+import logging
+import multiprocessing as mp
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from evaluation import evaluate
+from item_knn import baseline, fit_baselines
+
+
+N_FOLDS = 5
+SCHEMES = ("random", "time")
+SEED = 123
+N_WORKERS = int(os.environ.get("SLURM_CPUS_PER_TASK", os.cpu_count() or 1))
+
+# column name -> dtype of the materialized .npy arrays
+COLUMNS = {
+    "movie_id": np.int16,
+    "user_id": np.int32,
+    "rating": np.int8,
+    "date": np.int16,       # days since 1970-01-01
+}
+
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+
+# --------------------------
+# Rating arrays
+# --------------------------
+
+def _source_info(ratings_parquet: str) -> dict:
+    return {
+        "source": str(ratings_parquet),
+        "mtime": Path(ratings_parquet).stat().st_mtime,
+        "n_rows": pq.ParquetFile(ratings_parquet).metadata.num_rows,
+    }
+
+
+def materialize_ratings(ratings_parquet: str, folds_dir: Path):
+    """
+    Write the rating columns as .npy files. Skipped if arrays built from the
+    same source (path, mtime and row count) are already present.
+    """
+    meta_path = folds_dir / "ratings.json"
+    source = _source_info(ratings_parquet)
+    if meta_path.exists() and all((folds_dir / f"{c}.npy").exists() for c in COLUMNS):
+        with open(meta_path) as f:
+            if json.load(f) == source:
+                logging.info("Rating arrays already materialized in %s", folds_dir)
+                return
+        logging.info("Rating arrays in %s are stale, rebuilding", folds_dir)
+
+    logging.info("Loading ratings from: %s", ratings_parquet)
+    df = pd.read_parquet(ratings_parquet, columns=list(COLUMNS))
+    df["date"] = pd.to_datetime(df["date"]).values.astype("datetime64[D]").astype(np.int64)
+
+    folds_dir.mkdir(parents=True, exist_ok=True)
+    for c, dtype in COLUMNS.items():
+        logging.info("Writing %s.npy (%d rows)", c, len(df))
+        np.save(folds_dir / f"{c}.npy", df[c].to_numpy().astype(dtype))
+    with open(meta_path, "w") as f:
+        json.dump(source, f, indent=2)
+
+
+def load_ratings(folds_dir: Path) -> dict:
+    return {c: np.load(folds_dir / f"{c}.npy", mmap_mode="r") for c in COLUMNS}
+
+
+# --------------------------
+# Fold assignment
+# --------------------------
+
+def fold_path(folds_dir: Path, scheme: str, n_folds: int) -> Path:
+    return folds_dir / f"folds_{scheme}_k{n_folds}.npy"
+
+
+def assign_random(n_rows: int, n_folds: int, seed: int = SEED) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n_folds, size=n_rows, dtype=np.uint8)
+
+
+def assign_time(user_ids, dates, n_folds: int) -> np.ndarray:
+    """Fold = chronological slice of each user's own ratings."""
+    order = np.lexsort((dates, user_ids))
+    sorted_users = np.asarray(user_ids)[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    rank = np.arange(len(order)) - np.repeat(starts, sizes)
+
+    folds = np.empty(len(order), dtype=np.uint8)
+    folds[order] = (rank * n_folds // np.repeat(sizes, sizes)).astype(np.uint8)
+    return folds
+
+
+def _check_n_folds(n_folds: int):
+    if not 2 <= n_folds <= 255:
+        raise ValueError(f"n_folds must be between 2 and 255, got {n_folds}")
+
+
+def build_folds(folds_dir: Path, scheme: str, n_folds: int = N_FOLDS, seed: int = SEED):
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown fold scheme: {scheme!r}")
+    _check_n_folds(n_folds)
+
+    arrays = load_ratings(folds_dir)
+    n_rows = len(arrays["rating"])
+    logging.info("Assigning %d %s folds over %d ratings", n_folds, scheme, n_rows)
+
+    if scheme == "random":
+        folds = assign_random(n_rows, n_folds, seed)
+    else:
+        folds = assign_time(arrays["user_id"], arrays["date"], n_folds)
+
+    out = fold_path(folds_dir, scheme, n_folds)
+    np.save(out, folds)
+    counts = np.bincount(folds, minlength=n_folds)
+    with open(out.with_suffix(".json"), "w") as f:
+        json.dump({"scheme": scheme, "n_folds": n_folds, "seed": seed,
+                   "n_rows": n_rows, "fold_sizes": counts.tolist()}, f, indent=2)
+    logging.info("Wrote %s, fold sizes: %s", out, counts.tolist())
+
+
+# --------------------------
+# Iteration
+# --------------------------
+
+def fold_masks(folds: np.ndarray, k: int, scheme: str):
+    """(train_mask, test_mask) boolean arrays for fold k."""
+    test = folds == k
+    train = folds < k if scheme == "time" else ~test
+    return train, test
+
+
+def eval_folds(scheme: str, n_folds: int = N_FOLDS):
+    """Folds that can be evaluated (time folds need earlier data to train on)."""
+    return list(range(1 if scheme == "time" else 0, n_folds))
+
+
+def _run_fold(args):
+    fn, folds_dir, scheme, n_folds, k = args
+    arrays = load_ratings(Path(folds_dir))
+    folds = np.load(fold_path(Path(folds_dir), scheme, n_folds), mmap_mode="r")
+    if len(folds) != len(arrays["rating"]):
+        raise ValueError(
+            f"{len(folds)} fold ids for {len(arrays['rating'])} ratings; rebuild the folds"
+        )
+    train, test = fold_masks(folds, k, scheme)
+    return k, fn(arrays, train, test)
+
+
+def map_folds(fn, folds_dir: Path, scheme: str, n_folds: int = N_FOLDS,
+              n_workers: int = N_WORKERS) -> dict:
+    """
+    Run fn(arrays, train_mask, test_mask) for every fold in a process pool.
+
+    fn must be a module-level function; arrays are the memory-mapped rating
+    columns. Returns {fold: fn result}.
+    """
+    _check_n_folds(n_folds)
+    ks = eval_folds(scheme, n_folds)
+    tasks = [(fn, str(folds_dir), scheme, n_folds, k) for k in ks]
+    with mp.get_context("fork").Pool(min(n_workers, len(tasks))) as pool:
+        return dict(pool.imap_unordered(_run_fold, tasks))
+
+
+def baseline_fold(arrays, train, test) -> dict:
+    """Baseline (mu + b_i + b_u) model scored on one fold."""
+    # index the memmaps first so only the fold's subset is copied and cast
+    movie_ids, user_ids = arrays["movie_id"], arrays["user_id"]
+    ratings = arrays["rating"]
+
+    mu, movie_bias, user_bias = fit_baselines(
+        movie_ids[train], user_ids[train], ratings[train].astype(np.float32)
+    )
+    pred = baseline(mu, movie_bias, user_bias, movie_ids[test], user_ids[test])
+    result = evaluate(pred, ratings[test])
+    return {"n": result["n"], "rmse": result["rmse"], "mae": result["mae"]}
+
+
+def main():
+    setup_logging()
+    project_root = Path(__file__).resolve().parents[2]
+    ratings_parquet = project_root / "data" / "processed" / "ratings_train_no_probe.parquet"
+    folds_dir = project_root / "data" / "processed" / "folds"
+
+    logging.info("Project root: %s", project_root)
+    logging.info("Ratings (train no probe): %s", ratings_parquet)
+    logging.info("Folds dir: %s", folds_dir)
+
+    materialize_ratings(str(ratings_parquet), folds_dir)
+
+    for scheme in SCHEMES:
+        build_folds(folds_dir, scheme)
+
+        results = map_folds(baseline_fold, folds_dir, scheme)
+        for k in sorted(results):
+            r = results[k]
+            logging.info("[%s] fold %d: RMSE = %.4f, MAE = %.4f (n = %d)",
+                         scheme, k, r["rmse"], r["mae"], r["n"])
+        rmses = [r["rmse"] for r in results.values()]
+        logging.info("[%s] baseline CV RMSE = %.4f +/- %.4f",
+                     scheme, np.mean(rmses), np.std(rmses))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Vectorized evaluation of aligned prediction / label arrays.
+
+Works for any model: predictions and labels are plain arrays, loaded from
+.npy or a Parquet column. Besides overall RMSE / MAE, errors are broken
+down by strata (user activity, movie popularity, rating year, cold-start
+status) using precomputed integer bucket codes, so a full breakdown on the
+1.4M probe rows is a handful of np.bincount calls.
+
+Usage (predictions must be in probe_ratings.parquet row order):
+
+    python src/models/evaluation.py [predictions.npy | predictions.parquet COLUMN]
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+# Bucket edges on n_ratings in training; values below the first edge are cold
+USER_ACTIVITY_EDGES = [1, 10, 50, 100, 250, 500, 1000]
+MOVIE_POPULARITY_EDGES = [1, 100, 1000, 5000, 20000, 100000]
+
+COLD_START_LABELS = ["warm", "cold user", "cold movie", "cold both"]
+
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+
+def load_array(path: str, column: str = None) -> np.ndarray:
+    """Load a 1-D array from .npy (memory-mapped) or one Parquet column."""
+    path = Path(path)
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    if column is None:
+        raise ValueError(f"A column name is required to read {path}")
+    return pd.read_parquet(path, columns=[column])[column].to_numpy()
+
+
+# --------------------------
+# Strata
+# --------------------------
+
+def _bucket_labels(edges):
+    labels = ["0 (cold)"]
+    for lo, hi in zip(edges, edges[1:]):
+        labels.append(f"{lo}-{hi - 1}")
+    labels.append(f"{edges[-1]}+")
+    return labels
+
+
+def _count_lookup(ids: np.ndarray, counts: np.ndarray, size: int) -> np.ndarray:
+    table = np.zeros(size, dtype=np.int64)
+    table[ids] = counts
+    return table
+
+
+def build_strata(movie_ids, user_ids, dates, user_features: pd.DataFrame,
+                 movie_features: pd.DataFrame) -> dict:
+    """
+    Bucket codes for each evaluation row.
+
+    Returns {stratum name: (int16 codes, list of bucket labels)}. Users or
+    movies missing from the feature tables count as having zero ratings.
+    """
+    size = int(max(user_ids.max(), user_features["user_id"].max())) + 1
+    user_n = _count_lookup(
+        user_features["user_id"].to_numpy(), user_features["n_ratings"].to_numpy(), size
+    )[user_ids]
+
+    size = int(max(movie_ids.max(), movie_features["movie_id"].max())) + 1
+    movie_n = _count_lookup(
+        movie_features["movie_id"].to_numpy(), movie_features["n_ratings"].to_numpy(), size
+    )[movie_ids]
+
+    years = np.asarray(dates, dtype="datetime64[Y]").astype(np.int64) + 1970
+    first_year = int(years.min())
+    year_labels = [str(y) for y in range(first_year, int(years.max()) + 1)]
+
+    cold = (user_n == 0).astype(np.int16) + 2 * (movie_n == 0).astype(np.int16)
+
+    return {
+        "user_activity": (
+            np.digitize(user_n, USER_ACTIVITY_EDGES).astype(np.int16),
+            _bucket_labels(USER_ACTIVITY_EDGES),
+        ),
+        "movie_popularity": (
+            np.digitize(movie_n, MOVIE_POPULARITY_EDGES).astype(np.int16),
+            _bucket_labels(MOVIE_POPULARITY_EDGES),
+        ),
+        "rating_year": ((years - first_year).astype(np.int16), year_labels),
+        "cold_start": (cold, COLD_START_LABELS),
+    }
+
+
+def save_strata(strata: dict, path: str, sources: dict = None):
+    """Save strata; sources ({path: mtime}) is stored to detect stale caches."""
+    arrays = {}
+    for name, (codes, labels) in strata.items():
+        arrays[f"{name}__codes"] = codes
+        arrays[f"{name}__labels"] = np.asarray(labels)
+    sources = sources or {}
+    arrays["_source_paths"] = np.asarray(list(sources), dtype=str)
+    arrays["_source_mtimes"] = np.asarray(list(sources.values()), dtype=np.float64)
+    np.savez(path, **arrays)
+
+
+def load_strata(path: str) -> dict:
+    with np.load(path) as f:
+        names = [k[: -len("__codes")] for k in f.files if k.endswith("__codes")]
+        return {n: (f[f"{n}__codes"], list(f[f"{n}__labels"])) for n in names}
+
+
+def strata_sources(path: str) -> dict:
+    """{source path: mtime} recorded when the strata cache was written."""
+    with np.load(path) as f:
+        if "_source_paths" not in f.files:
+            return {}
+        return dict(zip(f["_source_paths"].tolist(), f["_source_mtimes"].tolist()))
+
+
+# --------------------------
+# Metrics
+# --------------------------
+
+def evaluate(pred, label, strata: dict = None) -> dict:
+    """
+    RMSE / MAE overall and per stratum bucket.
+
+    Returns {"rmse", "mae", "n", "strata": {name: DataFrame}}; each stratum
+    DataFrame has columns bucket, n, rmse, mae (empty buckets dropped).
+    """
+    if len(pred) != len(label):
+        raise ValueError(f"{len(pred)} predictions for {len(label)} labels")
+    err = np.asarray(pred, dtype=np.float64) - np.asarray(label, dtype=np.float64)
+    sq = err * err
+    ab = np.abs(err)
+    n = len(err)
+
+    result = {
+        "n": n,
+        "rmse": float(np.sqrt(sq.sum() / n)),
+        "mae": float(ab.sum() / n),
+        "strata": {},
+    }
+
+    for name, (codes, labels) in (strata or {}).items():
+        if len(codes) != n:
+            raise ValueError(f"Stratum {name!r} has {len(codes)} codes for {n} predictions")
+        counts = np.bincount(codes, minlength=len(labels))
+        sq_sum = np.bincount(codes, weights=sq, minlength=len(labels))
+        ab_sum = np.bincount(codes, weights=ab, minlength=len(labels))
+        nonempty = counts > 0
+        result["strata"][name] = pd.DataFrame({
+            "bucket": np.asarray(labels)[nonempty],
+            "n": counts[nonempty],
+            "rmse": np.sqrt(sq_sum[nonempty] / counts[nonempty]),
+            "mae": ab_sum[nonempty] / counts[nonempty],
+        })
+
+    return result
+
+
+def log_report(result: dict, model_name: str):
+    logging.info("*** %s: RMSE = %.4f, MAE = %.4f (n = %d) ***",
+                 model_name, result["rmse"], result["mae"], result["n"])
+    for name, table in result["strata"].items():
+        logging.info("Error by %s:\n%s", name, table.to_string(index=False, float_format="%.4f"))
+
+
+def probe_strata(proc_dir: Path) -> dict:
+    """
+    Load cached probe strata, rebuilding them from the feature tables when
+    the cache is missing or any source file changed since it was written.
+    """
+    cache = proc_dir / "probe_strata.npz"
+    probe_path = proc_dir / "probe_ratings.parquet"
+    sources = {
+        str(p): p.stat().st_mtime
+        for p in (probe_path, proc_dir / "user_features.parquet",
+                  proc_dir / "movie_features.parquet")
+    }
+
+    if cache.exists():
+        strata = load_strata(str(cache))
+        n_rows = pq.ParquetFile(probe_path).metadata.num_rows
+        fresh = strata_sources(str(cache)) == sources and all(
+            len(codes) == n_rows for codes, _ in strata.values()
+        )
+        if fresh:
+            return strata
+        logging.info("Probe strata cache is stale, rebuilding")
+
+    logging.info("Building probe strata -> %s", cache)
+    probe = pd.read_parquet(probe_path, columns=["movie_id", "user_id", "date"])
+    strata = build_strata(
+        probe["movie_id"].to_numpy(),
+        probe["user_id"].to_numpy(),
+        probe["date"].to_numpy(),
+        pd.read_parquet(proc_dir / "user_features.parquet", columns=["user_id", "n_ratings"]),
+        pd.read_parquet(proc_dir / "movie_features.parquet", columns=["movie_id", "n_ratings"]),
+    )
+    save_strata(strata, str(cache), sources)
+    return strata
+
+
+def report_probe(pred, proc_dir: Path, model_name: str, label=None) -> dict:
+    """
+    Evaluate probe predictions (in probe_ratings.parquet order) and log the
+    report. The stratified breakdown is skipped if the feature tables have
+    not been built.
+    """
+    proc_dir = Path(proc_dir)
+    if label is None:
+        label = load_array(str(proc_dir / "probe_ratings.parquet"), column="rating")
+
+    features = [proc_dir / "user_features.parquet", proc_dir / "movie_features.parquet"]
+    missing = [str(p) for p in features if not p.exists()]
+    if missing:
+        logging.warning("Feature tables missing (%s); reporting overall error only",
+                        ", ".join(missing))
+        strata = None
+    else:
+        strata = probe_strata(proc_dir)
+
+    result = evaluate(pred, label, strata)
+    log_report(result, model_name)
+    return result
+
+
+def main():
+    setup_logging()
+    project_root = Path(__file__).resolve().parents[2]
+    proc_dir = project_root / "data" / "processed"
+
+    if len(sys.argv) > 1:
+        pred_path = Path(sys.argv[1])
+    else:
+        pred_path = project_root / "collaborative_filtering" / "item_knn_probe_predictions.npy"
+    column = sys.argv[2] if len(sys.argv) > 2 else None
+
+    logging.info("Project root: %s", project_root)
+    logging.info("Predictions: %s%s", pred_path, f" [{column}]" if column else "")
+
+    pred = load_array(str(pred_path), column=column)
+    report_probe(pred, proc_dir, pred_path.stem)
+
+
+if __name__ == "__main__":
+    main()
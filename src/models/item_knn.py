@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Item-item kNN collaborative filtering.
+
+Similarities are computed between movies from the movie-major ratings
+matrix with blocked sparse-matrix products spread across a process pool.
+Only the top-N neighbours per movie are kept (int16 movie ids + float32
+similarities), so the full 17,770 x 17,770 matrix is never materialized.
+
+Prediction for (user u, movie i):
+
+    r_ui = b_ui + sum_j s_ij (r_uj - b_uj) / sum_j |s_ij|
+
+over the (up to K) most similar neighbours j of i that u has rated, where
+b_ui = mu + b_i + b_u is the regularized baseline.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from evaluation import report_probe
+
+
+# Model settings
+SIMILARITY = "pearson"   # "pearson" (baseline residuals) or "cosine" (raw ratings)
+SHRINKAGE = 100.0        # s_ij *= n_ij / (n_ij + SHRINKAGE)
+N_NEIGHBORS = 100        # neighbours stored per movie
+K = 30                   # neighbours used per prediction
+MOVIE_BIAS_REG = 25.0
+USER_BIAS_REG = 10.0
+
+# Execution settings
+BLOCK_SIZE = 256         # movie rows per similarity block
+SCORE_BATCH = 200_000    # (user, movie) pairs per scoring batch
+N_WORKERS = int(os.environ.get("SLURM_CPUS_PER_TASK", os.cpu_count() or 1))
+
+# Matrices shared with forked similarity workers (set before the pool starts)
+_SHARED = {}
+
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+
+def load_ratings(ratings_parquet: str):
+    df = pd.read_parquet(ratings_parquet, columns=["movie_id", "user_id", "rating"])
+    return (
+        df["movie_id"].to_numpy(np.int32),
+        df["user_id"].to_numpy(np.int32),
+        df["rating"].to_numpy(np.float32),
+    )
+
+
+# --------------------------
+# Baselines
+# --------------------------
+
+def fit_baselines(movie_ids, user_ids, ratings):
+    """Regularized global mean + movie bias + user bias (one pass each)."""
+    mu = float(ratings.mean())
+    n_movie_slots = int(movie_ids.max()) + 1
+    n_user_slots = int(user_ids.max()) + 1
+
+    resid = ratings - mu
+    movie_bias = (
+        np.bincount(movie_ids, weights=resid, minlength=n_movie_slots)
+        / (np.bincount(movie_ids, minlength=n_movie_slots) + MOVIE_BIAS_REG)
+    ).astype(np.float32)
+
+    resid = resid - movie_bias[movie_ids]
+    user_bias = (
+        np.bincount(user_ids, weights=resid, minlength=n_user_slots)
+        / (np.bincount(user_ids, minlength=n_user_slots) + USER_BIAS_REG)
+    ).astype(np.float32)
+
+    return mu, movie_bias, user_bias
+
+
+def baseline(mu, movie_bias, user_bias, movie_ids, user_ids):
+    """Baseline predictions; movies/users unseen in training get zero bias."""
+    bi = np.zeros(len(movie_ids), dtype=np.float32)
+    known = movie_ids < len(movie_bias)
+    bi[known] = movie_bias[movie_ids[known]]
+
+    bu = np.zeros(len(user_ids), dtype=np.float32)
+    known = user_ids < len(user_bias)
+    bu[known] = user_bias[user_ids[known]]
+
+    return mu + bi + bu
+
+
+# --------------------------
+# Similarities
+# --------------------------
+
+def _block_topn(bounds):
+    start, stop = bounds
+    X, XT = _SHARED["X"], _SHARED["XT"]
+    B, BT = _SHARED["B"], _SHARED["BT"]
+
+    numer = (X[start:stop] @ XT).toarray()
+    common = (B[start:stop] @ BT).toarray()
+
+    if _SHARED["similarity"] == "pearson":
+        # squared residuals summed over co-rating users only
+        X2, X2T = _SHARED["X2"], _SHARED["X2T"]
+        sq_i = (X2[start:stop] @ BT).toarray()
+        sq_j = (B[start:stop] @ X2T).toarray()
+        denom = np.sqrt(sq_i * sq_j)
+    else:
+        norms = _SHARED["norms"]
+        denom = np.outer(norms[start:stop], norms)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sim = np.where(denom > 0, numer / denom, 0.0)
+    sim *= common / (common + _SHARED["shrinkage"])
+
+    rows = np.arange(stop - start)
+    sim[rows, np.arange(start, stop)] = -np.inf   # never a neighbour of itself
+    sim[:, 0] = -np.inf                           # movie ids start at 1
+
+    n = _SHARED["n_neighbors"]
+    top = np.argpartition(-sim, n, axis=1)[:, :n]
+    top_sim = np.take_along_axis(sim, top, axis=1)
+    order = np.argsort(-top_sim, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_sim = np.take_along_axis(top_sim, order, axis=1)
+
+    return start, top.astype(np.int16), top_sim.astype(np.float32)
+
+
+def compute_neighbors(movie_ids, user_ids, values, similarity=SIMILARITY,
+                      shrinkage=SHRINKAGE, n_neighbors=N_NEIGHBORS,
+                      block_size=BLOCK_SIZE, n_workers=N_WORKERS):
+    """
+    Top-N neighbour table from (movie, user, value) triples, where value is
+    the baseline residual for "pearson" or the raw rating for "cosine".
+
+    Returns (neighbors, sims), both shaped (max_movie_id + 1, n_neighbors);
+    row 0 is unused. n_neighbors is capped at the number of other movies.
+    """
+    n_movie_slots = int(movie_ids.max()) + 1
+    if n_movie_slots < 3:
+        raise ValueError("Need at least two movies to compute neighbours")
+    n_neighbors = min(n_neighbors, n_movie_slots - 2)
+    shape = (n_movie_slots, int(user_ids.max()) + 1)
+
+    X = sp.csr_matrix((values.astype(np.float32), (movie_ids, user_ids)), shape=shape)
+    B = X.copy()
+    B.data[:] = 1.0
+
+    _SHARED.clear()
+    _SHARED.update(
+        X=X, XT=X.T.tocsr(), B=B, BT=B.T.tocsr(),
+        similarity=similarity, shrinkage=shrinkage, n_neighbors=n_neighbors,
+    )
+    if similarity == "pearson":
+        X2 = X.multiply(X).tocsr()
+        _SHARED.update(X2=X2, X2T=X2.T.tocsr())
+    elif similarity == "cosine":
+        _SHARED["norms"] = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    else:
+        raise ValueError(f"Unknown similarity: {similarity!r}")
+
+    neighbors = np.zeros((n_movie_slots, n_neighbors), dtype=np.int16)
+    sims = np.zeros((n_movie_slots, n_neighbors), dtype=np.float32)
+    blocks = [(s, min(s + block_size, n_movie_slots))
+              for s in range(0, n_movie_slots, block_size)]
+
+    logging.info("Computing %s similarities: %d blocks on %d workers",
+                 similarity, len(blocks), n_workers)
+
+    # fork so workers share the matrices copy-on-write instead of pickling them
+    with mp.get_context("fork").Pool(n_workers) as pool:
+        for done, (start, top, top_sim) in enumerate(
+            pool.imap_unordered(_block_topn, blocks), start=1
+        ):
+            neighbors[start:start + len(top)] = top
+            sims[start:start + len(top)] = top_sim
+            if done % 10 == 0 or done == len(blocks):
+                logging.info("  %d / %d blocks done", done, len(blocks))
+
+    _SHARED.clear()
+    sims[0] = 0.0
+    return neighbors, sims
+
+
+# --------------------------
+# Model I/O
+# --------------------------
+
+def fit(ratings_parquet: str, model_out: str):
+    """Fit and save the model; returns the loaded (movie_ids, user_ids, ratings)."""
+    logging.info("Loading training ratings from: %s", ratings_parquet)
+    movie_ids, user_ids, ratings = load_ratings(ratings_parquet)
+    logging.info("Ratings rows: %d", len(ratings))
+
+    mu, movie_bias, user_bias = fit_baselines(movie_ids, user_ids, ratings)
+    logging.info("Global mean: %.4f", mu)
+
+    if SIMILARITY == "pearson":
+        values = ratings - baseline(mu, movie_bias, user_bias, movie_ids, user_ids)
+    else:
+        values = ratings
+    neighbors, sims = compute_neighbors(movie_ids, user_ids, values)
+
+    out_path = Path(model_out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    logging.info("Writing model to: %s", out_path)
+    np.savez(
+        out_path,
+        neighbors=neighbors,
+        sims=sims,
+        mu=np.float32(mu),
+        movie_bias=movie_bias,
+        user_bias=user_bias,
+    )
+    return movie_ids, user_ids, ratings
+
+
+def load_model(model_path: str) -> dict:
+    with np.load(model_path) as f:
+        return {k: f[k] for k in f.files}
+
+
+# --------------------------
+# Scoring
+# --------------------------
+
+class RatingIndex:
+    """
+    User-major sorted (user, movie) keys with aligned baseline residuals,
+    so a user's rating of any movie is one searchsorted away.
+    """
+
+    def __init__(self, model: dict, movie_ids, user_ids, ratings):
+        self.stride = np.int64(len(model["movie_bias"]))
+        keys = user_ids.astype(np.int64) * self.stride + movie_ids
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        resid = ratings - baseline(
+            model["mu"], model["movie_bias"], model["user_bias"], movie_ids, user_ids
+        )
+        self.resid = resid[order].astype(np.float32)
+
+    def lookup(self, user_ids, movie_ids):
+        """Residuals for (user, movie) grids of equal shape; hit mask marks rated."""
+        q = user_ids.astype(np.int64) * self.stride + movie_ids
+        pos = np.searchsorted(self.keys, q)
+        pos[pos == len(self.keys)] = 0
+        hit = self.keys[pos] == q
+        return np.where(hit, self.resid[pos], 0.0), hit
+
+
+def predict(model: dict, index: RatingIndex, movie_ids, user_ids, k=K,
+            batch_size=SCORE_BATCH):
+    """Vectorized predictions for aligned movie_ids / user_ids arrays."""
+    neighbors, sims = model["neighbors"], model["sims"]
+    preds = baseline(model["mu"], model["movie_bias"], model["user_bias"],
+                     movie_ids, user_ids)
+
+    for start in range(0, len(movie_ids), batch_size):
+        stop = min(start + batch_size, len(movie_ids))
+        m = movie_ids[start:stop]
+        u = user_ids[start:stop]
+
+        known = m < len(neighbors)
+        m_safe = np.where(known, m, 0)
+        nbr = neighbors[m_safe].astype(np.int64)
+        w = sims[m_safe]
+
+        resid, hit = index.lookup(u[:, None], nbr)
+        # neighbours are sorted by similarity: keep the first k the user rated
+        hit &= np.cumsum(hit, axis=1) <= k
+        w = np.where(hit & known[:, None], w, 0.0)
+
+        numer = (w * resid).sum(axis=1)
+        denom = np.abs(w).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            preds[start:stop] += np.where(denom > 0, numer / denom, 0.0)
+
+    return np.clip(preds, 1.0, 5.0)
+
+
+def main():
+    setup_logging()
+    project_root = Path(__file__).resolve().parents[2]
+    proc = project_root / "data" / "processed"
+
+    ratings_parquet = proc / "ratings_train_no_probe.parquet"
+    probe_parquet = proc / "probe_ratings.parquet"
+    qual_parquet = proc / "qualifying_to_predict.parquet"
+    model_path = proc / "item_knn_model.npz"
+    out_dir = project_root / "collaborative_filtering"
+
+    logging.info("Project root: %s", project_root)
+    logging.info("Ratings (train no probe): %s", ratings_parquet)
+    logging.info("Model out: %s", model_path)
+
+    train = fit(str(ratings_parquet), str(model_path))
+    model = load_model(str(model_path))
+
+    logging.info("Building user rating index...")
+    index = RatingIndex(model, *train)
+    del train
+
+    logging.info("Scoring probe pairs...")
+    probe = pd.read_parquet(probe_parquet, columns=["movie_id", "user_id", "rating"])
+    pred_probe = predict(
+        model, index,
+        probe["movie_id"].to_numpy(np.int32), probe["user_id"].to_numpy(np.int32),
+    )
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "item_knn_probe_predictions.npy", pred_probe.astype(np.float32))
+
+    logging.info("Scoring qualifying pairs...")
+    qual = pd.read_parquet(qual_parquet, columns=["movie_id", "user_id"])
+    qual["pred_rating"] = predict(
+        model, index,
+        qual["movie_id"].to_numpy(np.int32), qual["user_id"].to_numpy(np.int32),
+    )
+
+    qual_out = out_dir / "item_knn_qual_predictions.csv"
+    logging.info("Writing qualifying predictions to: %s", qual_out)
+    qual[["movie_id", "user_id", "pred_rating"]].to_csv(qual_out, index=False)
+
+    # report last so a missing feature table can never cost the outputs
+    report_probe(pred_probe, proc, "Probe (item kNN)", label=probe["rating"].to_numpy())
+
+    logging.info("Done.")
+
+
+if __name__ == "__main__":
+    main()